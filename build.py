@@ -1,431 +1,144 @@
 #!/usr/bin/env python3
 """Build script to generate static site for GitHub Pages."""
 
+import gzip
 import json
-import re
+import os
+from functools import cache
+from operator import itemgetter
 from pathlib import Path
 
+from utils import load_page_names, sanitize_filename
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; the stdlib encoder produces the same output
+    orjson = None
+
 BASE_DIR = Path(__file__).parent
 DOCS_DIR = BASE_DIR / "docs"
 DRUGS_DIR = DOCS_DIR / "drugs"
 NAMES_FILE = BASE_DIR / "page_names.json"
-
-
-def sanitize_filename(name: str) -> str:
-    """Convert drug name to a safe filename (must match generate_drug_images.py)."""
-    # Replace non-breaking space and regular space
-    name = name.replace('\xa0', ' ')
-    name = re.sub(r'[<>:"/\\|?*]', "_", name)
-    name = name.replace(" ", "_")
-    name = re.sub(r"_+", "_", name)
-    return name.strip("_")
+TEMPLATE_FILE = BASE_DIR / "template.html"
+INDEX_CACHE_FILE = BASE_DIR / ".index_cache"
+# The code that shapes index.html: this script and the filename helper it matches drugs with
+SOURCE_FILES = (Path(__file__), BASE_DIR / "utils.py")
 
 
 def get_available_drugs() -> dict[str, str]:
-    """Scan drugs directory for available HTML files and build entries."""
-    if not DRUGS_DIR.exists():
-        return {}
-
-    # Get all HTML files
-    html_files = {f.stem: f.name for f in DRUGS_DIR.glob("*.html")}
-    return html_files
-
-
-def load_page_names() -> dict[str, list[int]]:
-    """Load page names from JSON file."""
-    if NAMES_FILE.exists():
-        with open(NAMES_FILE, encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-
-def generate_html(entries: list[dict]) -> str:
-    """Generate static HTML with responsive drug viewer using iframes."""
-    entries_json = json.dumps(entries, ensure_ascii=False, indent=2)
-
-    # Generate options HTML
-    options_html = ""
-    for i, entry in enumerate(entries):
-        name = entry["name"]
-        options_html += f'            <option value="{i}" data-name="{name.lower()}">{name}</option>\n'
-
-    html = f'''<!DOCTYPE html>
-<html lang="vi">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Hướng dẫn hiệu chỉnh liều trên BN suy thận 2026 - BVĐK Nghệ An</title>
-    <link rel="icon" type="image/x-icon" href="favicon.ico">
-    <link rel="icon" type="image/png" href="favicon.png">
-    <link rel="apple-touch-icon" href="logo.png">
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-
-        body {{
-            font-family: system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            height: 100vh;
-            display: flex;
-            flex-direction: column;
-            background: #f5f5f5;
-        }}
-
-        .header {{
-            padding: 0.5rem 1rem;
-            background: #2e7d32;
-            display: flex;
-            gap: 0.75rem;
-            align-items: center;
-            flex-wrap: wrap;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.2);
-        }}
-
-        .logo {{
-            height: 40px;
-            width: auto;
-            background: white;
-            border-radius: 4px;
-            padding: 2px;
-        }}
-
-        .site-title {{
-            color: white;
-            font-size: 0.95rem;
-            font-weight: 600;
-        }}
-
-        .search-input {{
-            flex: 1;
-            min-width: 150px;
-            padding: 0.5rem 0.75rem;
-            font-size: 0.9rem;
-            border: none;
-            border-radius: 4px;
-            background: rgba(255,255,255,0.9);
-            color: #333;
-            outline: none;
-        }}
-
-        .search-input::placeholder {{
-            color: #666;
-        }}
-
-        .search-input:focus {{
-            background: white;
-            box-shadow: 0 0 0 2px rgba(255,255,255,0.5);
-        }}
-
-        .drug-select {{
-            padding: 0.5rem 0.75rem;
-            font-size: 0.9rem;
-            min-width: 200px;
-            border: none;
-            border-radius: 4px;
-            background: rgba(255,255,255,0.9);
-            color: #333;
-            cursor: pointer;
-        }}
-
-        .nav-buttons {{
-            display: flex;
-            gap: 0.25rem;
-        }}
-
-        .nav-btn {{
-            padding: 0.5rem 0.75rem;
-            font-size: 0.9rem;
-            border: none;
-            border-radius: 4px;
-            background: rgba(255,255,255,0.2);
-            color: white;
-            cursor: pointer;
-            transition: background 0.2s;
-        }}
-
-        .nav-btn:hover {{
-            background: rgba(255,255,255,0.3);
-        }}
-
-        .nav-btn:disabled {{
-            opacity: 0.4;
-            cursor: not-allowed;
-        }}
-
-        .entry-info {{
-            font-size: 0.85rem;
-            color: rgba(255,255,255,0.9);
-            white-space: nowrap;
-        }}
-
-        .viewer {{
-            flex: 1;
-            overflow: auto;
-            background: #f5f5f5;
-        }}
-
-        .viewer iframe {{
-            width: 100%;
-            height: 100%;
-            border: none;
-        }}
-
-        .loading, .no-results, .error {{
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            height: 100%;
-            font-size: 1.1rem;
-            color: #666;
-        }}
-
-        .error {{
-            color: #c62828;
-        }}
-
-        /* Mobile adjustments */
-        @media (max-width: 768px) {{
-            .header {{
-                padding: 0.5rem;
-                gap: 0.5rem;
-            }}
+    """Scan drugs directory for available HTML files and build entries.
 
-            .logo {{
-                height: 32px;
-            }}
+    Raises FileNotFoundError if the directory does not exist.
+    """
+    # Get all HTML files; os.scandir avoids building a Path object per directory entry
+    with os.scandir(DRUGS_DIR) as it:
+        return {
+            entry.name.removesuffix(".html"): entry.name
+            for entry in it
+            if entry.name.endswith(".html") and entry.is_file()
+        }
 
-            .site-title {{
-                font-size: 0.85rem;
-            }}
 
-            .search-input {{
-                min-width: 120px;
-                font-size: 0.85rem;
-                padding: 0.4rem 0.6rem;
-            }}
+def get_input_stamp() -> str:
+    """Fingerprint the build inputs, and the code that turns them into index.html, by modification time.
 
-            .drug-select {{
-                min-width: 150px;
-                font-size: 0.85rem;
-                padding: 0.4rem 0.6rem;
-            }}
+    The drugs directory's mtime changes whenever an HTML file is added, removed or
+    renamed, which is all index.html depends on from it.
+    """
+    paths = (NAMES_FILE, DRUGS_DIR, TEMPLATE_FILE, *SOURCE_FILES)
+    return ":".join(str(path.stat().st_mtime_ns) for path in paths)
 
-            .nav-btn {{
-                padding: 0.4rem 0.6rem;
-                font-size: 0.85rem;
-            }}
 
-            .entry-info {{
-                font-size: 0.8rem;
-            }}
-        }}
+def dump_entries(entries: list[dict]) -> bytes:
+    """Serialize entries as compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(entries)
+    # json.dumps without indent uses the C encoder, whereas json.dump always
+    # falls back to the pure-Python iterencode path
+    return json.dumps(entries, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
-        @media (max-width: 480px) {{
-            .header {{
-                flex-direction: column;
-                align-items: center;
-            }}
 
-            .logo {{
-                height: 36px;
-            }}
+@cache
+def load_template() -> tuple[bytes, bytes]:
+    """Load the page shell once as UTF-8 bytes, split around the entries placeholder."""
+    template = TEMPLATE_FILE.read_bytes()
+    head, tail = template.split(b"{{ENTRIES_JSON}}")
+    return head, tail
 
-            .site-title {{
-                font-size: 0.9rem;
-                text-align: center;
-            }}
 
-            .search-input, .drug-select {{
-                width: 100%;
-                min-width: unset;
-            }}
-
-            .nav-buttons {{
-                justify-content: center;
-            }}
-
-            .entry-info {{
-                text-align: center;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <img src="logo.png" alt="BVĐK Nghệ An" class="logo">
-        <span class="site-title">Hướng dẫn hiệu chỉnh liều trên BN suy thận 2026</span>
-        <input type="text" class="search-input" id="search" placeholder="Tìm kiếm thuốc...">
-        <select class="drug-select" id="drugSelect">
-{options_html}        </select>
-        <div class="nav-buttons">
-            <button class="nav-btn" id="prevBtn" title="Trước">&larr;</button>
-            <button class="nav-btn" id="nextBtn" title="Sau">&rarr;</button>
-        </div>
-        <span class="entry-info" id="entryInfo"></span>
-    </div>
-    <div class="viewer" id="viewerContainer">
-        <div class="loading">Đang tải...</div>
-    </div>
-
-    <script>
-        const search = document.getElementById('search');
-        const drugSelect = document.getElementById('drugSelect');
-        const viewerContainer = document.getElementById('viewerContainer');
-        const prevBtn = document.getElementById('prevBtn');
-        const nextBtn = document.getElementById('nextBtn');
-        const entryInfo = document.getElementById('entryInfo');
-
-        // Embedded entries data
-        const allEntries = {entries_json};
-
-        let currentEntries = [...allEntries];
-
-        function updateEntryInfo() {{
-            const currentIndex = drugSelect.selectedIndex;
-            const total = drugSelect.options.length;
-            if (total > 0) {{
-                entryInfo.textContent = `${{currentIndex + 1}} / ${{total}}`;
-            }} else {{
-                entryInfo.textContent = '';
-            }}
-            prevBtn.disabled = currentIndex <= 0;
-            nextBtn.disabled = currentIndex >= total - 1;
-        }}
-
-        function updateViewer() {{
-            const selectedIdx = drugSelect.selectedIndex;
-            if (selectedIdx < 0 || currentEntries.length === 0) {{
-                viewerContainer.innerHTML = '<div class="no-results">Không tìm thấy kết quả</div>';
-                updateEntryInfo();
-                return;
-            }}
-
-            const entry = currentEntries[selectedIdx];
-            const iframe = document.createElement('iframe');
-            iframe.src = 'drugs/' + entry.file;
-            iframe.title = entry.name;
-
-            viewerContainer.innerHTML = '';
-            viewerContainer.appendChild(iframe);
-
-            updateEntryInfo();
-        }}
-
-        drugSelect.addEventListener('change', updateViewer);
-
-        prevBtn.addEventListener('click', () => {{
-            if (drugSelect.selectedIndex > 0) {{
-                drugSelect.selectedIndex--;
-                updateViewer();
-            }}
-        }});
-
-        nextBtn.addEventListener('click', () => {{
-            if (drugSelect.selectedIndex < drugSelect.options.length - 1) {{
-                drugSelect.selectedIndex++;
-                updateViewer();
-            }}
-        }});
-
-        // Debounce function for search
-        function debounce(func, wait) {{
-            let timeout;
-            return function executedFunction(...args) {{
-                const later = () => {{
-                    clearTimeout(timeout);
-                    func(...args);
-                }};
-                clearTimeout(timeout);
-                timeout = setTimeout(later, wait);
-            }};
-        }}
-
-        const handleSearch = debounce(() => {{
-            const query = search.value.toLowerCase().trim();
-
-            // Filter entries
-            currentEntries = allEntries.filter(entry => entry.name.toLowerCase().includes(query));
-
-            // Rebuild select
-            drugSelect.innerHTML = '';
-            currentEntries.forEach((entry, idx) => {{
-                const option = document.createElement('option');
-                option.value = idx;
-                option.dataset.name = entry.name.toLowerCase();
-                option.textContent = entry.name;
-                drugSelect.appendChild(option);
-            }});
-
-            updateViewer();
-        }}, 150);
-
-        search.addEventListener('input', handleSearch);
-
-        // Keyboard navigation
-        document.addEventListener('keydown', (e) => {{
-            if (e.target === search) return;
-
-            if (e.key === 'ArrowLeft') {{
-                prevBtn.click();
-            }} else if (e.key === 'ArrowRight') {{
-                nextBtn.click();
-            }}
-        }});
-
-        // Initialize
-        updateViewer();
-    </script>
-</body>
-</html>'''
-
-    return html
+def render_html(entries: list[dict]) -> bytes:
+    """Render the static HTML drug viewer (using iframes) as UTF-8 bytes."""
+    head, tail = load_template()
+    # Embedded entries data. "<" only occurs inside JSON strings; escaping it keeps a
+    # drug name containing "</script>" or "<!--" from breaking out of the script
+    entries_json = dump_entries(entries).replace(b"<", b"\\u003c")
+    return b"".join((head, entries_json, tail))
 
 
 def main() -> None:
     """Build the static site."""
     print("Building static site...")
 
-    # 1. Check drugs directory exists
-    if not DRUGS_DIR.exists():
+    # 1. Scan drugs directory for generated HTML files
+    try:
+        html_files = get_available_drugs()
+    except FileNotFoundError:
         print(f"Error: {DRUGS_DIR} does not exist.")
         print("Run 'uv run python generate_drug_images.py' first to generate HTML files.")
         return
 
     # 2. Load page names to get drug order and names
-    names = load_page_names()
+    names = load_page_names(NAMES_FILE)
     if not names:
         print("Error: No page_names.json found.")
         return
 
+    # Skip the rebuild if no input changed since the last successful build
+    index_path = DOCS_DIR / "index.html"
+    gz_path = index_path.with_name("index.html.gz")
+    stamp = get_input_stamp()
+    if (
+        index_path.exists()
+        and gz_path.exists()
+        and INDEX_CACHE_FILE.exists()
+        and INDEX_CACHE_FILE.read_text(encoding="utf-8") == stamp
+    ):
+        print(f"  Up to date: {index_path}")
+        return
+
     # 3. Build entries list from page_names.json, matching to HTML files
-    html_files = get_available_drugs()
-    entries = []
+    found = []
 
     for name, pages in names.items():
         safe_name = sanitize_filename(name)
-        if safe_name in html_files:
-            entries.append({
-                "name": name,
-                "file": html_files[safe_name],
-            })
-        else:
+        file = html_files.get(safe_name)
+        if file is None:
             print(f"  Warning: No HTML found for '{name}' (expected {safe_name}.html)")
+            continue
+        found.append((pages[0], name, file))
 
-    # Sort by original page order
-    name_to_pages = {name: pages[0] for name, pages in names.items()}
-    entries.sort(key=lambda x: name_to_pages.get(x["name"], 999))
+    # Sort by original page order (stable, so ties keep page_names.json order)
+    found.sort(key=itemgetter(0))
+    entries = [
+        # Lowercased once here so the search box doesn't redo it on every keystroke
+        {"name": name, "file": file, "lname": name.lower()}
+        for _, name, file in found
+    ]
 
     print(f"  Found {len(entries)} drug HTML files in {DRUGS_DIR}/")
 
-    # 4. Generate index.html
-    html = generate_html(entries)
-    index_path = DOCS_DIR / "index.html"
-    with open(index_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    # 4. Generate index.html, encoded once and written in a single call
+    html = render_html(entries)
+    index_path.write_bytes(html)
     print(f"  Generated {index_path}")
 
+    # 5. Precompressed copy for servers/CDNs that negotiate Content-Encoding
+    # (mtime=0 keeps the output reproducible between builds)
+    gz_path.write_bytes(gzip.compress(html, compresslevel=9, mtime=0))
+    print(f"  Generated {gz_path}")
+
+    INDEX_CACHE_FILE.write_text(stamp, encoding="utf-8")
+
     print(f"\nDone! Static site built in {DOCS_DIR}/")
     print(f"To test locally: cd {DOCS_DIR} && python -m http.server 8000")
 
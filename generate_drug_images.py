@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 """Generate responsive HTML files for each drug from DOCX source."""
 
-import re
+import posixpath
+import zipfile
 from html import escape
 from pathlib import Path
 
-from docx import Document
-from docx.table import Table, _Cell
+from lxml import etree
+
+from utils import sanitize_filename
 
 BASE_DIR = Path(__file__).parent
 DOCX_FILE = BASE_DIR / "data.docx"
@@ -21,103 +23,199 @@ COLUMN_HEADERS = [
     "Renal Pharmacotherapy 2021",
 ]
 
-
-def sanitize_filename(name: str) -> str:
-    """Convert drug name to a safe filename."""
-    # Replace non-breaking space and regular space
-    name = name.replace('\xa0', ' ')
-    name = re.sub(r'[<>:"/\\|?*]', '_', name)
-    name = name.replace(' ', '_')
-    name = re.sub(r'_+', '_', name)
-    return name.strip('_')
+# Clark-notation namespace prefixes for WordprocessingML and relationship tags/attributes
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+M = "{http://schemas.openxmlformats.org/officeDocument/2006/math}"
+
+# Package-level namespaces for the .docx parts read alongside word/document.xml
+PKG_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+PKG_TYPES = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+
+# Fully-qualified tags, so element dispatch is a plain string compare
+_BODY_TAG = W + "body"
+_P_TAG = W + "p"
+_TBL_TAG = W + "tbl"
+_TR_TAG = W + "tr"
+_TC_TAG = W + "tc"
+_TCPR_TAG = W + "tcPr"
+_GRID_SPAN_TAG = W + "gridSpan"
+_VAL_ATTR = W + "val"
+_R_TAG = W + "r"
+_T_TAG = W + "t"
+_BR_TAG = W + "br"
+_RPR_TAG = W + "rPr"
+_B_TAG = W + "b"
+_OMATH_TAG = M + "oMath"
+_OMATH_PARA_TAG = M + "oMathPara"
+
+# ST_OnOff values that switch a toggle property such as <w:b> off
+_OFF_VALUES = frozenset({"0", "false", "off"})
+
+
+def _get_tc_pr(tc):
+    """Get a <w:tc>'s <w:tcPr>, or None. The schema puts it first, so only the first child is checked."""
+    if len(tc) and tc[0].tag == _TCPR_TAG:
+        return tc[0]
+    return None
 
 
-def get_cell_span(cell: _Cell) -> tuple[int, int]:
-    """Get the column span and row span for a cell."""
-    tc = cell._tc
+def get_cell_span(tc) -> tuple[int, int]:
+    """Get the column span and row span for a <w:tc> (row span is always 1 for now)."""
     # Get grid span (colspan)
-    grid_span = tc.get("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}gridSpan")
+    grid_span = tc.get(_GRID_SPAN_TAG)
     if grid_span is not None:
-        colspan = int(grid_span)
-    else:
-        # Check tcPr for gridSpan
-        tc_pr = tc.find("{http://schemas.openxmlformats.org/wordprocessingml/2006/main}tcPr")
-        if tc_pr is not None:
-            grid_span_el = tc_pr.find(
-                "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}gridSpan"
-            )
-            if grid_span_el is not None:
-                colspan = int(
-                    grid_span_el.get(
-                        "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}val", "1"
-                    )
-                )
-            else:
-                colspan = 1
-        else:
-            colspan = 1
-
-    # Row span is more complex - for now just return 1
-    rowspan = 1
-    return colspan, rowspan
-
-
-def get_row_text(row) -> tuple[str, ...]:
+        return int(grid_span), 1
+
+    # Check tcPr for gridSpan
+    tc_pr = _get_tc_pr(tc)
+    if tc_pr is not None:
+        grid_span_el = tc_pr.find(_GRID_SPAN_TAG)
+        if grid_span_el is not None:
+            return int(grid_span_el.get(_VAL_ATTR, "1")), 1
+    return 1, 1
+
+
+def get_row_cells(tr) -> list:
+    """Get the layout-grid <w:tc> elements of a <w:tr>, as python-docx's row.cells would.
+
+    A cell spanning several grid columns is repeated once per column, and a vertically-merged
+    continuation cell is replaced by the cell it continues from the row above.
+    """
+    cells = []
+    for tc in tr.iterchildren(_TC_TAG):
+        while _get_vmerge(tc) == "continue":
+            tc = _get_tc_above(tc)
+        cells.extend([tc] * get_cell_span(tc)[0])
+    return cells
+
+
+def _get_vmerge(tc) -> str | None:
+    """Value of ./w:tcPr/w:vMerge/@w:val, "continue" when the element has no value."""
+    tc_pr = _get_tc_pr(tc)
+    if tc_pr is None:
+        return None
+    v_merge = tc_pr.find(W + "vMerge")
+    if v_merge is None:
+        return None
+    return v_merge.get(_VAL_ATTR, "continue")
+
+
+def _get_grid_before(tr) -> int:
+    """Number of unpopulated layout-grid columns at the start of a <w:tr>."""
+    grid_before = tr.find(W + "trPr/" + W + "gridBefore")
+    if grid_before is None:
+        return 0
+    return int(grid_before.get(_VAL_ATTR, "0"))
+
+
+def _get_tc_above(tc):
+    """Get the <w:tc> that starts at the same grid column in the previous row."""
+    tr = tc.getparent()
+    grid_offset = _get_grid_before(tr)
+    for sibling in tc.itersiblings(_TC_TAG, preceding=True):
+        grid_offset += get_cell_span(sibling)[0]
+
+    tr_above = next(tr.itersiblings(_TR_TAG, preceding=True))
+    remaining = grid_offset - _get_grid_before(tr_above)
+    for tc_above in tr_above.iterchildren(_TC_TAG):
+        if remaining < 0:
+            break
+        if remaining == 0:
+            return tc_above
+        remaining -= get_cell_span(tc_above)[0]
+    raise ValueError(f"no <w:tc> at grid offset {grid_offset} in the row above")
+
+
+# Text equivalents of run content other than <w:t>, matching python-docx's Run.text
+_RUN_CONTENT_TEXT = {
+    W + "tab": "\t",
+    W + "ptab": "\t",
+    W + "cr": "\n",
+    W + "noBreakHyphen": "-",
+}
+# Children of a paragraph's own runs, including runs inside hyperlinks, in document order.
+# Like python-docx's CT_P.text this skips runs nested in w:ins, w:sdt, textboxes and the like.
+_XP_PARAGRAPH_RUN_CONTENT = etree.XPath('w:r/*|w:hyperlink/w:r/*', namespaces={'w': W[1:-1]})
+
+
+def get_cell_text(tc) -> str:
+    """Get the plain text of a <w:tc>'s own paragraphs, one line per paragraph (like cell.text)."""
+    lines = []
+    for p in tc.iterchildren(_P_TAG):
+        # One lxml pass over the paragraph's run content instead of run by run
+        texts = []
+        for el in _XP_PARAGRAPH_RUN_CONTENT(p):
+            tag = el.tag
+            if tag == _T_TAG:
+                texts.append(el.text or "")
+            elif tag == _BR_TAG:
+                if el.get(W + "type", "textWrapping") == "textWrapping":
+                    texts.append("\n")
+            elif tag in _RUN_CONTENT_TEXT:
+                texts.append(_RUN_CONTENT_TEXT[tag])
+        lines.append("".join(texts))
+    return "\n".join(lines)
+
+
+def get_row_text(cells: list) -> tuple[str, ...]:
     """Get normalized text content of a row for comparison."""
     seen_cells = set()
     texts = []
-    for cell in row.cells:
-        cell_id = id(cell._tc)
+    for tc in cells:
+        cell_id = id(tc)
         if cell_id in seen_cells:
             continue
         seen_cells.add(cell_id)
-        texts.append(cell.text.strip().replace('\n', ' '))
+        texts.append(get_cell_text(tc).strip().replace('\n', ' '))
     return tuple(texts)
 
 
-def extract_nested_table_html(table: Table) -> str:
-    """Convert a nested DOCX table to HTML, handling merged cells and duplicate headers."""
-    html_parts = ['<table class="nested-table">']
+def extract_nested_table_html(tbl, out: list[str]) -> None:
+    """Append a nested DOCX table as HTML to `out`, handling merged cells and duplicate headers."""
+    out.append('<table class="nested-table">')
+
+    # Walk the rows once, read-only
+    rows = [get_row_cells(tr) for tr in tbl.iterchildren(_TR_TAG)]
 
     # Get first row text to detect duplicate headers
     first_row_text = None
-    if table.rows:
-        first_row_text = get_row_text(table.rows[0])
+    if rows:
+        first_row_text = get_row_text(rows[0])
 
-    for row_idx, row in enumerate(table.rows):
+    for row_idx, row_cells in enumerate(rows):
         # Skip duplicate header rows (rows that match the first row, except the first row itself)
         if row_idx > 0 and first_row_text:
-            current_row_text = get_row_text(row)
+            current_row_text = get_row_text(row_cells)
             if current_row_text == first_row_text:
                 continue  # Skip this duplicate header row
 
-        html_parts.append("<tr>")
+        out.append("<tr>")
         seen_cells = set()  # Track cells we've already processed (by their XML element id)
 
-        for cell in row.cells:
+        for tc in row_cells:
             # Skip if we've already processed this cell (merged cells appear multiple times)
-            cell_id = id(cell._tc)
+            cell_id = id(tc)
             if cell_id in seen_cells:
                 continue
             seen_cells.add(cell_id)
 
             # Get colspan
-            colspan, rowspan = get_cell_span(cell)
+            colspan, rowspan = get_cell_span(tc)
 
-            cell_text = escape(cell.text.strip())
+            cell_text = escape(get_cell_text(tc).strip())
             # Handle line breaks within cells
             cell_text = cell_text.replace("\n", "<br>")
 
             # Build td with colspan if needed
             if colspan > 1:
-                html_parts.append(f'<td colspan="{colspan}">{cell_text}</td>')
+                out.append(f'<td colspan="{colspan}">{cell_text}</td>')
             else:
-                html_parts.append(f"<td>{cell_text}</td>")
+                out.append(f"<td>{cell_text}</td>")
 
-        html_parts.append("</tr>")
+        out.append("</tr>")
 
-    html_parts.append("</table>")
-    return "".join(html_parts)
+    out.append("</table>")
 
 
 # XML namespaces for Office Math and Drawing
@@ -132,16 +230,48 @@ DRAWING_NS = {
     'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
 }
 
-# Global variable to store document part for image extraction
-_doc_part = None
+# Precompiled XPath queries, so the expressions are not re-parsed for every element
+_XP_FRACTIONS = etree.XPath('.//m:f', namespaces=MATH_NS)
+_XP_NUM_TEXTS = etree.XPath('.//m:num//m:t', namespaces=MATH_NS)
+_XP_DEN_TEXTS = etree.XPath('.//m:den//m:t', namespaces=MATH_NS)
+_XP_MATH_TEXTS = etree.XPath('.//m:t', namespaces=MATH_NS)
+_XP_MATHS = etree.XPath('.//m:oMath', namespaces=MATH_NS)
+_XP_RUN_TEXTS = etree.XPath('.//w:t', namespaces=MATH_NS)
+
+# Global variables to store the document's images (by relationship id) for image extraction
+_image_parts = None
 _image_counter = 0
 
 
+def load_image_parts(docx_zip: zipfile.ZipFile) -> dict[str, tuple[str, bytes]]:
+    """Map relationship ids of word/document.xml to the (content type, blob) of its images."""
+    content_types = etree.fromstring(docx_zip.read("[Content_Types].xml"))
+    defaults = {el.get("Extension").lower(): el.get("ContentType")
+                for el in content_types.iterchildren(PKG_TYPES + "Default")}
+    overrides = {el.get("PartName"): el.get("ContentType")
+                 for el in content_types.iterchildren(PKG_TYPES + "Override")}
+
+    rels = etree.fromstring(docx_zip.read("word/_rels/document.xml.rels"))
+    image_parts = {}
+    for rel in rels.iterchildren(PKG_RELS + "Relationship"):
+        if rel.get("TargetMode") == "External" or not rel.get("Type", "").endswith("/image"):
+            continue
+        target = rel.get("Target")
+        if target.startswith("/"):
+            part_name = target[1:]
+        else:
+            part_name = posixpath.normpath(posixpath.join("word", target))
+        ext = posixpath.splitext(part_name)[1][1:].lower()
+        content_type = overrides.get("/" + part_name) or defaults.get(ext, "")
+        image_parts[rel.get("Id")] = (content_type, docx_zip.read(part_name))
+    return image_parts
+
+
 def extract_image(drawing_element, drug_name: str) -> str | None:
     """Extract image from drawing element and save to disk. Returns image filename or None."""
-    global _doc_part, _image_counter
+    global _image_counter
 
-    if _doc_part is None:
+    if _image_parts is None:
         return None
 
     # Find blip element with image reference
@@ -150,19 +280,18 @@ def extract_image(drawing_element, drug_name: str) -> str | None:
         return None
 
     for blip in blips:
-        embed_id = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
+        embed_id = blip.get(R + 'embed')
         if not embed_id:
             continue
 
         # Get the image from relationships
-        rel = _doc_part.rels.get(embed_id)
-        if not rel:
+        image_part = _image_parts.get(embed_id)
+        if not image_part:
             continue
 
         try:
-            image_part = rel.target_part
+            content_type, blob = image_part
             # Determine extension from content type
-            content_type = image_part.content_type
             ext = 'png'
             if 'jpeg' in content_type or 'jpg' in content_type:
                 ext = 'jpg'
@@ -177,7 +306,7 @@ def extract_image(drawing_element, drug_name: str) -> str | None:
 
             # Save image
             with open(img_path, 'wb') as f:
-                f.write(image_part.blob)
+                f.write(blob)
 
             return img_filename
         except Exception as e:
@@ -186,343 +315,348 @@ def extract_image(drawing_element, drug_name: str) -> str | None:
     return None
 
 
-def extract_math_html(math_element) -> str:
-    """Convert Office Math (OMML) element to HTML representation."""
+def extract_math_html(math_element, out: list[str]) -> None:
+    """Append the HTML representation of an Office Math (OMML) element to `out`."""
     # Check for fractions
-    fracs = math_element.findall('.//m:f', namespaces=MATH_NS)
+    fracs = _XP_FRACTIONS(math_element)
     if fracs:
-        result_parts = []
         for frac in fracs:
-            num_texts = frac.findall('.//m:num//m:t', namespaces=MATH_NS)
-            den_texts = frac.findall('.//m:den//m:t', namespaces=MATH_NS)
+            num_texts = _XP_NUM_TEXTS(frac)
+            den_texts = _XP_DEN_TEXTS(frac)
             num = ''.join([t.text or '' for t in num_texts])
             den = ''.join([t.text or '' for t in den_texts])
             # Create HTML fraction using CSS
-            result_parts.append(
+            out.append(
                 f'<span class="fraction">'
                 f'<span class="frac-num">{escape(num)}</span>'
                 f'<span class="frac-den">{escape(den)}</span>'
                 f'</span>'
             )
-        return ''.join(result_parts)
+        return
 
     # Fallback: just extract all text
-    texts = math_element.findall('.//m:t', namespaces=MATH_NS)
-    return escape(''.join([t.text or '' for t in texts]))
+    texts = _XP_MATH_TEXTS(math_element)
+    out.append(escape(''.join([t.text or '' for t in texts])))
 
 
-def extract_paragraph_html(para_element, drug_name: str = "") -> str:
-    """Extract HTML from a paragraph element, including math formulas and images."""
-    html_parts = []
-
+def extract_paragraph_html(para_element, out: list[str], drug_name: str = "") -> None:
+    """Append HTML for a paragraph element to `out`, including math formulas and images."""
     for child in para_element:
-        tag = child.tag.split('}')[-1]  # Get tag name without namespace
+        tag = child.tag
 
-        if tag == 'oMath':
+        if tag == _OMATH_TAG:
             # Math formula
-            html_parts.append(extract_math_html(child))
-        elif tag == 'r':
+            extract_math_html(child, out)
+        elif tag == _R_TAG:
             # Regular run - check for drawings (images) first
-            drawing = child.find('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing')
+            drawing = child.find('.//' + W + 'drawing')
             if drawing is not None:
                 img_filename = extract_image(drawing, drug_name)
                 if img_filename:
-                    html_parts.append(f'<img src="{img_filename}" class="embedded-image" alt="Graph">')
+                    out.append(f'<img src="{img_filename}" class="embedded-image" alt="Graph">')
                 continue
 
             # Get text
-            t_elements = child.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
+            t_elements = _XP_RUN_TEXTS(child)
             text = ''.join([t.text or '' for t in t_elements])
             if text:
                 # Check if bold
-                rPr = child.find('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}rPr')
+                rPr = child.find(_RPR_TAG)
                 is_bold = False
                 if rPr is not None:
-                    bold_el = rPr.find('{http://schemas.openxmlformats.org/wordprocessingml/2006/main}b')
-                    is_bold = bold_el is not None
+                    bold_el = rPr.find(_B_TAG)
+                    # <w:b w:val="0"/> (or "false"/"off") explicitly turns bold off
+                    is_bold = bold_el is not None and bold_el.get(_VAL_ATTR) not in _OFF_VALUES
 
                 if is_bold:
-                    html_parts.append(f'<strong>{escape(text)}</strong>')
+                    out.append(f'<strong>{escape(text)}</strong>')
                 else:
-                    html_parts.append(escape(text))
-        elif tag == 'oMathPara':
+                    out.append(escape(text))
+        elif tag == _OMATH_PARA_TAG:
             # Math paragraph - contains oMath elements
-            math_elements = child.findall('.//m:oMath', namespaces=MATH_NS)
+            math_elements = _XP_MATHS(child)
             for math_el in math_elements:
-                html_parts.append(extract_math_html(math_el))
+                extract_math_html(math_el, out)
 
-    return ''.join(html_parts)
 
-
-def extract_cell_html(cell: _Cell, drug_name: str = "") -> str:
-    """Convert cell content (paragraphs + nested tables) to HTML."""
+def extract_cell_html(tc, drug_name: str = "") -> str:
+    """Convert <w:tc> content (paragraphs + nested tables) to HTML."""
     html_parts = []
 
-    # Track which nested tables we've processed
-    nested_tables = list(cell.tables)
-    table_idx = 0
-
-    # Process cell's XML to maintain order of paragraphs and tables
-    for element in cell._tc:
-        if element.tag.endswith('}p'):  # Paragraph
+    # Process cell's XML to maintain order of paragraphs and tables; lxml skips tcPr and
+    # any other children itself
+    for element in tc.iterchildren(_P_TAG, _TBL_TAG):
+        if element.tag == _P_TAG:  # Paragraph
             # Extract paragraph content including math and images
-            para_html = extract_paragraph_html(element, drug_name)
-            if para_html.strip():
-                html_parts.append(f'<p>{para_html}</p>')
-        elif element.tag.endswith('}tbl'):  # Table
-            if table_idx < len(nested_tables):
-                html_parts.append(extract_nested_table_html(nested_tables[table_idx]))
-                table_idx += 1
+            start = len(html_parts)
+            html_parts.append('<p>')
+            extract_paragraph_html(element, html_parts, drug_name)
+            if any(part.strip() for part in html_parts[start + 1:]):
+                html_parts.append('</p>')
+            else:
+                del html_parts[start:]  # Drop empty paragraphs
+        else:  # Table
+            extract_nested_table_html(element, html_parts)
 
     return ''.join(html_parts) if html_parts else '&nbsp;'
 
 
-def generate_html_for_drug(drug_name: str, header_cells: list[str], drug_cells: list[str]) -> str:
+def generate_html_for_drug(escaped_name: str, escaped_headers: list[str], drug_cells: list[str]) -> str:
     """Generate responsive HTML fragment for a single drug (no full document wrapper)."""
     # Build card sections for each column (skip first column - drug name)
-    sections_html = ""
-    for i in range(1, len(header_cells)):
-        header = escape(header_cells[i])
+    sections = []
+    for i in range(1, len(escaped_headers)):
+        header = escaped_headers[i]
         content = drug_cells[i] if i < len(drug_cells) else "&nbsp;"
-        sections_html += f'''
+        sections.append(f'''
         <div class="info-section">
             <div class="section-header">{header}</div>
             <div class="section-content">{content}</div>
-        </div>'''
+        </div>''')
+    sections_html = "".join(sections)
 
-    html = f'''<div class="drug-card" data-drug="{escape(drug_name)}">
-    <div class="drug-name">{escape(drug_name)}</div>
+    html = f'''<div class="drug-card" data-drug="{escaped_name}">
+    <div class="drug-name">{escaped_name}</div>
     {sections_html}
 </div>'''
     return html
 
 
-def generate_standalone_html(drug_name: str, header_cells: list[str], drug_cells: list[str]) -> str:
-    """Generate complete standalone HTML document for a single drug."""
-    card_html = generate_html_for_drug(drug_name, header_cells, drug_cells)
-
-    html = f'''<!DOCTYPE html>
+# Standalone page shell; the CSS braces are literal, only the {{...}} markers are filled per drug
+_STANDALONE_TEMPLATE = '''<!DOCTYPE html>
 <html lang="vi">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{escape(drug_name)} - Hướng dẫn hiệu chỉnh liều</title>
+    <title>{{TITLE}} - Hướng dẫn hiệu chỉnh liều</title>
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
 
-        body {{
+        body {
             font-family: system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
             font-size: 14px;
             line-height: 1.5;
             background: #f5f5f5;
             padding: 16px;
-        }}
+        }
 
-        .drug-card {{
+        .drug-card {
             background: white;
             border-radius: 8px;
             box-shadow: 0 2px 8px rgba(0,0,0,0.1);
             overflow: hidden;
             max-width: 1200px;
             margin: 0 auto;
-        }}
+        }
 
-        .drug-name {{
+        .drug-name {
             background: linear-gradient(135deg, #2e7d32, #4caf50);
             color: white;
             font-size: 1.25rem;
             font-weight: 600;
             padding: 16px 20px;
-        }}
+        }
 
-        .info-section {{
+        .info-section {
             border-bottom: 1px solid #e0e0e0;
-        }}
+        }
 
-        .info-section:last-child {{
+        .info-section:last-child {
             border-bottom: none;
-        }}
+        }
 
-        .section-header {{
+        .section-header {
             background: #e8f5e9;
             color: #1b5e20;
             font-weight: 600;
             font-size: 0.9rem;
             padding: 12px 16px;
             border-bottom: 1px solid #c8e6c9;
-        }}
+        }
 
-        .section-content {{
+        .section-content {
             padding: 16px;
             font-size: 0.95rem;
-        }}
+        }
 
-        .section-content p {{
+        .section-content p {
             margin: 8px 0;
-        }}
+        }
 
-        .section-content p:first-child {{
+        .section-content p:first-child {
             margin-top: 0;
-        }}
+        }
 
-        .section-content p:last-child {{
+        .section-content p:last-child {
             margin-bottom: 0;
-        }}
+        }
 
         /* Math fraction styling */
-        .fraction {{
+        .fraction {
             display: inline-flex;
             flex-direction: column;
             align-items: center;
             vertical-align: middle;
             margin: 0 4px;
             font-size: 0.85em;
-        }}
+        }
 
-        .frac-num {{
+        .frac-num {
             border-bottom: 1px solid #333;
             padding: 0 4px 2px 4px;
-        }}
+        }
 
-        .frac-den {{
+        .frac-den {
             padding: 2px 4px 0 4px;
-        }}
+        }
 
         /* Nested tables for ClCr dosing */
-        .nested-table {{
+        .nested-table {
             width: 100%;
             border-collapse: collapse;
             margin: 12px 0;
             font-size: 0.85rem;
-        }}
+        }
 
-        .nested-table td {{
+        .nested-table td {
             border: 1px solid #ccc;
             padding: 8px 12px;
             text-align: center;
-        }}
+        }
 
-        .nested-table tr:first-child td {{
+        .nested-table tr:first-child td {
             background: #f5f5f5;
             font-weight: 600;
-        }}
+        }
 
-        .nested-table tr:nth-child(even) td {{
+        .nested-table tr:nth-child(even) td {
             background: #fafafa;
-        }}
+        }
 
-        strong {{
+        strong {
             font-weight: 600;
-        }}
+        }
 
         /* Embedded images */
-        .embedded-image {{
+        .embedded-image {
             max-width: 100%;
             height: auto;
             display: block;
             margin: 12px auto;
             border: 1px solid #ddd;
             border-radius: 4px;
-        }}
+        }
 
         /* Responsive adjustments */
-        @media (max-width: 768px) {{
-            body {{
+        @media (max-width: 768px) {
+            body {
                 padding: 8px;
-            }}
+            }
 
-            .drug-name {{
+            .drug-name {
                 font-size: 1.1rem;
                 padding: 12px 16px;
-            }}
+            }
 
-            .section-header {{
+            .section-header {
                 font-size: 0.85rem;
                 padding: 10px 12px;
-            }}
+            }
 
-            .section-content {{
+            .section-content {
                 padding: 12px;
                 font-size: 0.9rem;
-            }}
+            }
 
-            .nested-table {{
+            .nested-table {
                 font-size: 0.8rem;
-            }}
+            }
 
-            .nested-table td {{
+            .nested-table td {
                 padding: 6px 8px;
-            }}
-        }}
+            }
+        }
 
-        @media (max-width: 480px) {{
-            .nested-table {{
+        @media (max-width: 480px) {
+            .nested-table {
                 font-size: 0.75rem;
-            }}
+            }
 
-            .nested-table td {{
+            .nested-table td {
                 padding: 4px 6px;
-            }}
-        }}
+            }
+        }
     </style>
 </head>
 <body>
-    {card_html}
+    {{CARD_HTML}}
 </body>
 </html>'''
-    return html
+
+# Split at the markers once, so each page is a plain concatenation with no template parsing
+_STANDALONE_HEAD, _rest = _STANDALONE_TEMPLATE.split("{{TITLE}}")
+_STANDALONE_MIDDLE, _STANDALONE_TAIL = _rest.split("{{CARD_HTML}}")
+del _rest
+
+
+def generate_standalone_html(escaped_name: str, escaped_headers: list[str], drug_cells: list[str]) -> str:
+    """Generate complete standalone HTML document for a single drug."""
+    card_html = generate_html_for_drug(escaped_name, escaped_headers, drug_cells)
+    return "".join((_STANDALONE_HEAD, escaped_name, _STANDALONE_MIDDLE, card_html, _STANDALONE_TAIL))
 
 
 def save_html_file(html: str, output_path: Path) -> None:
     """Save HTML content to file."""
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    # Encode once and write the bytes, skipping the text-mode wrapper
+    output_path.write_bytes(html.encode("utf-8"))
 
 
 def main() -> None:
     """Generate responsive HTML files for all drugs."""
-    global _doc_part, _image_counter
+    global _image_parts, _image_counter
 
     print("Generating drug HTML files from DOCX...")
 
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Load DOCX
-    doc = Document(DOCX_FILE)
-    main_table = doc.tables[0]
-
-    # Set document part for image extraction
-    _doc_part = doc.part
+    # Load DOCX: the document part is parsed once with lxml and walked read-only
+    with zipfile.ZipFile(DOCX_FILE) as docx_zip:
+        document = etree.fromstring(docx_zip.read("word/document.xml"))
+        # Set document images for image extraction
+        _image_parts = load_image_parts(docx_zip)
     _image_counter = 0
+    main_table = document.find(_BODY_TAG).find(_TBL_TAG)
 
     # Extract header row
-    header_row = main_table.rows[0]
-    header_cells = [cell.text.strip().replace("\n", " ") for cell in header_row.cells]
+    tr_list = list(main_table.iterchildren(_TR_TAG))
+    header_cells = [get_cell_text(tc).strip().replace("\n", " ") for tc in get_row_cells(tr_list[0])]
     print(f"Header: {header_cells}")
 
+    # The headers are the same for every drug, so escape them once
+    escaped_headers = [escape(header) for header in header_cells]
+
     # Count drugs
-    drug_count = len(main_table.rows) - 1
+    drug_count = len(tr_list) - 1
     print(f"Found {drug_count} drugs to process")
 
     success_count = 0
-    for row_idx, row in enumerate(main_table.rows[1:], start=1):
-        drug_name = row.cells[0].text.strip()
+    for row_idx, tr in enumerate(tr_list[1:], start=1):
+        row_cells = get_row_cells(tr)
+        drug_name = get_cell_text(row_cells[0]).strip()
         print(f"\n[{row_idx}/{drug_count}] Processing: {drug_name}...")
 
         try:
             # Extract cell HTML for each column
-            drug_cells = []
-            for cell in row.cells:
-                cell_html = extract_cell_html(cell, drug_name)
-                drug_cells.append(cell_html)
+            drug_cells = [extract_cell_html(tc, drug_name) for tc in row_cells]
 
             # Generate standalone HTML
-            html = generate_standalone_html(drug_name, header_cells, drug_cells)
+            # Escape the name once for the title, the data-drug attribute and the card heading
+            html = generate_standalone_html(escape(drug_name), escaped_headers, drug_cells)
 
             # Generate filename and save
             safe_name = sanitize_filename(drug_name)
@@ -1,39 +1,33 @@
 #!/usr/bin/env python3
 """Split PDF into individual drug files with header row included."""
 
-import json
-import re
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Annotated
 
 import fitz  # PyMuPDF
 
+from utils import load_page_names, sanitize_filename
+
 BASE_DIR = Path(__file__).parent
 SOURCE_PDF = BASE_DIR / "data.pdf"
 NAMES_FILE = BASE_DIR / "page_names.json"
 OUTPUT_DIR = BASE_DIR / "docs" / "drugs"
+MANIFEST_FILE = OUTPUT_DIR / ".split_manifest"
+# The code that shapes the split output: this script and the filename helper it uses
+SOURCE_FILES = (Path(__file__), BASE_DIR / "utils.py")
 
 # Header row height (approximate, in points) - covers the table header
 HEADER_HEIGHT = 55  # Will be refined based on actual PDF
 
-
-def load_drug_pages() -> dict[str, list[int]]:
-    """Load drug name to page mapping from page_names.json."""
-    if NAMES_FILE.exists():
-        with open(NAMES_FILE, encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-
-def sanitize_filename(name: str) -> str:
-    """Convert drug name to a safe filename."""
-    # Replace problematic characters
-    name = re.sub(r'[<>:"/\\|?*]', '_', name)
-    # Replace spaces with underscores
-    name = name.replace(' ', '_')
-    # Remove consecutive underscores
-    name = re.sub(r'_+', '_', name)
-    return name.strip('_')
+# Per-worker state, set up once by _init_worker (fitz documents cannot be pickled)
+_doc: fitz.Document | None = None
+_drugs: dict[str, list[int]] = {}
+_header_rect: fitz.Rect | None = None
+_page_to_drugs: dict[int, list[str]] = {}
+_name_positions: dict[tuple[str, int], list[tuple[float, float]]] = {}
 
 
 def format_pages_string(pages: list[int]) -> str:
@@ -46,22 +40,66 @@ def format_pages_string(pages: list[int]) -> str:
         return f"p{'-'.join(str(p) for p in pages)}"
 
 
-def get_drug_order_on_page(doc: fitz.Document, page_num: int, drug_names: list[str]) -> list[tuple[str, float]]:
+def get_output_filename(drug_name: str, pages: list[int]) -> str:
+    """Get the output PDF filename for a drug."""
+    return f"{sanitize_filename(drug_name)}_{format_pages_string(pages)}.pdf"
+
+
+def compute_source_hash(pdf_data: bytes) -> str:
+    """Hash the source PDF, page mapping and splitting code, which together determine the split output."""
+    # blake2b is faster than sha256 and we only need to detect accidental changes
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pdf_data)
+    h.update(NAMES_FILE.read_bytes())
+    for path in SOURCE_FILES:
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def is_split_up_to_date(source_hash: str, drugs: dict[str, list[int]]) -> bool:
+    """Check whether the previous split used the same inputs and all its PDFs still exist."""
+    if not MANIFEST_FILE.exists():
+        return False
+    if MANIFEST_FILE.read_text(encoding="utf-8").strip() != source_hash:
+        return False
+
+    with os.scandir(OUTPUT_DIR) as it:
+        existing = {entry.name for entry in it}
+    return all(get_output_filename(name, pages) in existing for name, pages in drugs.items())
+
+
+def find_name_positions(
+    doc: fitz.Document,
+    drugs: dict[str, list[int]],
+) -> dict[tuple[str, int], list[tuple[float, float]]]:
+    """Search each drug name once on each of its pages.
+
+    Returns {(drug_name, page_num): [(x0, y0), ...]} for every match, in search order.
+    """
+    positions = {}
+    for drug_name, pages in drugs.items():
+        for page_num in pages:
+            page = doc[page_num - 1]  # 0-indexed
+            positions[drug_name, page_num] = [(inst.x0, inst.y0) for inst in page.search_for(drug_name)]
+    return positions
+
+
+def get_drug_order_on_page(
+    page: fitz.Page,
+    page_num: int,
+    drug_names: list[str],
+    name_positions: dict[tuple[str, int], list[tuple[float, float]]],
+) -> list[tuple[str, float]]:
     """Get the y-positions of drug names on a specific page."""
-    page = doc[page_num - 1]  # 0-indexed
     results = []
+    page_width = page.rect.width
 
     for drug_name in drug_names:
-        # Search for the drug name on the page
-        text_instances = page.search_for(drug_name)
-        if text_instances:
+        # Filter to instances in the left portion of the page (drug name column)
+        left_y = [y0 for x0, y0 in name_positions[drug_name, page_num] if x0 < page_width * 0.15]
+        if left_y:
             # Get the first instance (should be in the first column)
-            # Filter to instances in the left portion of the page (drug name column)
-            page_width = page.rect.width
-            left_instances = [inst for inst in text_instances if inst.x0 < page_width * 0.15]
-            if left_instances:
-                y_pos = left_instances[0].y0
-                results.append((drug_name, y_pos))
+            results.append((drug_name, left_y[0]))
 
     # Sort by y position
     results.sort(key=lambda x: x[1])
@@ -72,11 +110,14 @@ def find_drug_row_bounds(
     doc: fitz.Document,
     drug_name: str,
     pages: list[int],
-    all_drugs: dict[str, list[int]],
+    page_to_drugs: dict[int, list[str]],
+    name_positions: dict[tuple[str, int], list[tuple[float, float]]],
+    warnings: list[str],
 ) -> list[tuple[int, fitz.Rect]]:
     """Find the bounding rectangles for a drug's row across its pages.
 
-    Returns list of (page_num, rect) tuples.
+    Returns list of (page_num, rect) tuples. Warnings are appended to `warnings` rather than
+    printed, since this runs in a worker and the parent prints each drug's log in order.
     """
     bounds = []
 
@@ -84,33 +125,30 @@ def find_drug_row_bounds(
         page = doc[page_num - 1]  # 0-indexed
         page_rect = page.rect
 
-        # Search for the drug name text
-        text_instances = page.search_for(drug_name)
+        # Look up the drug name matches found by find_name_positions
+        text_instances = name_positions[drug_name, page_num]
         if not text_instances:
             # If exact match not found, try partial match
-            print(f"  Warning: '{drug_name}' not found on page {page_num}, using full page")
+            warnings.append(f"Warning: '{drug_name}' not found on page {page_num}, using full page")
             bounds.append((page_num, page_rect))
             continue
 
         # Get instances in the drug name column (left side)
         page_width = page_rect.width
-        left_instances = [inst for inst in text_instances if inst.x0 < page_width * 0.15]
+        left_instances = [inst for inst in text_instances if inst[0] < page_width * 0.15]
 
         if not left_instances:
             # Fall back to any instance
             left_instances = text_instances
 
-        drug_y_top = left_instances[0].y0 - 5  # Small padding above
+        drug_y_top = left_instances[0][1] - 5  # Small padding above
 
         # Find the next drug's y position to determine row bottom
         # Get all drugs that appear on this page
-        drugs_on_page = []
-        for d_name, d_pages in all_drugs.items():
-            if page_num in d_pages:
-                drugs_on_page.append(d_name)
+        drugs_on_page = page_to_drugs[page_num]
 
         # Get ordered list of drugs on this page by y position
-        drug_positions = get_drug_order_on_page(doc, page_num, drugs_on_page)
+        drug_positions = get_drug_order_on_page(page, page_num, drugs_on_page, name_positions)
 
         # Find our drug and the next one
         drug_y_bottom = page_rect.height  # Default to bottom of page
@@ -151,17 +189,20 @@ def extract_header_region(doc: fitz.Document) -> fitz.Rect:
     # 1. Title row at the very top
     # 2. Column headers (Tên hoạt chất, Dược thư Quốc gia, etc.)
 
-    # Search for "Tên hoạt chất" to find header position
-    header_text = page.search_for("Tên")
-    if header_text:
-        header_bottom = header_text[0].y1 + 5  # Add small padding
-    else:
-        header_bottom = HEADER_HEIGHT
-
-    # Search for "hoạt chất" to be more precise
-    header_text2 = page.search_for("hoạt chất")
-    if header_text2:
-        header_bottom = max(header_bottom, header_text2[0].y1 + 5)
+    # Find "Tên hoạt chất" to locate the header, reading the page's words once
+    # (x0, y0, x1, y1, word, block_no, line_no, word_no)
+    words = page.get_text("words")
+    header_bottom = HEADER_HEIGHT
+    for word in words:
+        if word[4] == "Tên":
+            header_bottom = word[3] + 5  # Add small padding
+            break
+
+    # Use the bottom of "hoạt chất" to be more precise
+    for prev, word in zip(words, words[1:]):
+        if prev[4] == "hoạt" and word[4] == "chất":
+            header_bottom = max(header_bottom, max(prev[3], word[3]) + 5)
+            break
 
     return fitz.Rect(0, 0, page_rect.width, header_bottom)
 
@@ -217,18 +258,47 @@ def create_drug_pdf(
         current_y += row_height
 
     # Generate filename
-    safe_name = sanitize_filename(drug_name)
-    pages_str = format_pages_string(pages)
-    filename = f"{safe_name}_{pages_str}.pdf"
-    output_path = OUTPUT_DIR / filename
+    output_path = OUTPUT_DIR / get_output_filename(drug_name, pages)
 
-    # Save the new PDF
-    new_doc.save(output_path)
+    # Save the new PDF, merging duplicate objects and compressing streams. Write to a
+    # temporary file and swap it in, so an interrupted run never leaves a truncated PDF
+    # behind that the manifest check would accept as complete.
+    tmp_path = output_path.with_suffix(".pdf.tmp")
+    new_doc.save(tmp_path, garbage=3, deflate=True)
     new_doc.close()
+    os.replace(tmp_path, output_path)
 
     return output_path
 
 
+def _init_worker(
+    pdf_data: bytes,
+    drugs: dict[str, list[int]],
+    header_rect: tuple[float, float, float, float],
+    page_to_drugs: dict[int, list[str]],
+    name_positions: dict[tuple[str, int], list[tuple[float, float]]],
+) -> None:
+    """Open the in-memory source PDF once per worker process."""
+    global _doc, _drugs, _header_rect, _page_to_drugs, _name_positions
+    _doc = fitz.open(stream=pdf_data, filetype="pdf")
+    _drugs = drugs
+    _header_rect = fitz.Rect(header_rect)
+    _page_to_drugs = page_to_drugs
+    _name_positions = name_positions
+
+
+def _split_drug(drug_name: str) -> tuple[str, list[str]]:
+    """Find the row bounds for a drug and write its PDF. Runs in a worker process.
+
+    Returns the output filename and any warnings, for the parent to print.
+    """
+    pages = _drugs[drug_name]
+    warnings: list[str] = []
+    row_bounds = find_drug_row_bounds(_doc, drug_name, pages, _page_to_drugs, _name_positions, warnings)
+    output_path = create_drug_pdf(_doc, drug_name, pages, _header_rect, row_bounds)
+    return output_path.name, warnings
+
+
 def main() -> None:
     """Split PDF into individual drug files."""
     print("Splitting PDF by drug...")
@@ -236,39 +306,66 @@ def main() -> None:
     # Create output directory
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Load source PDF
-    doc = fitz.open(SOURCE_PDF)
-    print(f"Loaded {SOURCE_PDF} ({doc.page_count} pages)")
-
     # Load drug-to-page mapping
-    drugs = load_drug_pages()
+    drugs = load_page_names(NAMES_FILE)
     if not drugs:
         print("Error: No drug mappings found in page_names.json")
         return
 
     print(f"Found {len(drugs)} drugs to extract")
 
+    # Invert the mapping once, so finding the drugs that share a page is a dict lookup
+    page_to_drugs: dict[int, list[str]] = {}
+    for drug_name, pages in drugs.items():
+        for page_num in pages:
+            page_to_drugs.setdefault(page_num, []).append(drug_name)
+
+    # Skip splitting if neither the PDF, the page mapping nor the splitting code changed since the last run
+    pdf_data = SOURCE_PDF.read_bytes()
+    source_hash = compute_source_hash(pdf_data)
+    if is_split_up_to_date(source_hash, drugs):
+        print(f"Up to date: {SOURCE_PDF.name}, {NAMES_FILE.name} and the split code unchanged, skipping split.")
+        return
+
+    # Forget the previous split before overwriting its PDFs, so a run that fails partway
+    # can't leave a manifest vouching for a mix of old and new output
+    MANIFEST_FILE.unlink(missing_ok=True)
+
+    # Load source PDF from memory, so object lookups during the split don't hit the file
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    print(f"Loaded {SOURCE_PDF} ({doc.page_count} pages)")
+
     # Extract header region
     header_rect = extract_header_region(doc)
     print(f"Header region: height={header_rect.height:.1f}pt")
 
-    # Process each drug
-    success_count = 0
-    for drug_name, pages in drugs.items():
-        print(f"\nProcessing: {drug_name} (pages {pages})...")
-
-        try:
-            # Find row bounds
-            row_bounds = find_drug_row_bounds(doc, drug_name, pages, drugs)
+    # Search every drug name once per page here, instead of each worker re-searching all
+    # the drugs that share a page for every drug on it
+    name_positions = find_name_positions(doc, drugs)
+    doc.close()
 
-            # Create the drug PDF
-            output_path = create_drug_pdf(doc, drug_name, pages, header_rect, row_bounds)
-            print(f"  Created: {output_path.name}")
-            success_count += 1
-        except Exception as e:
-            print(f"  Error: {e}")
+    # Process drugs in parallel, one worker per core; each worker opens its own copy of the PDF
+    success_count = 0
+    initargs = (pdf_data, drugs, tuple(header_rect), page_to_drugs, name_positions)
+    with ProcessPoolExecutor(initializer=_init_worker, initargs=initargs) as executor:
+        futures = {drug_name: executor.submit(_split_drug, drug_name) for drug_name in drugs}
+
+        for drug_name, future in futures.items():
+            print(f"\nProcessing: {drug_name} (pages {drugs[drug_name]})...")
+
+            try:
+                filename, warnings = future.result()
+                for warning in warnings:
+                    print(f"  {warning}")
+                print(f"  Created: {filename}")
+                success_count += 1
+            except Exception as e:
+                print(f"  Error: {e}")
+
+    # Only record the inputs once every drug was split, so a partial run is retried
+    if success_count == len(drugs):
+        MANIFEST_FILE.write_text(source_hash, encoding="utf-8")
 
-    doc.close()
     print(f"\nDone! Created {success_count}/{len(drugs)} drug PDFs in {OUTPUT_DIR}/")
 
 
@@ -0,0 +1,24 @@
+"""Helpers shared by the build scripts."""
+
+import json
+import re
+from functools import cache
+from pathlib import Path
+
+# Characters that are unsafe in filenames, plus regular and non-breaking spaces, all become underscores
+_UNSAFE_TO_UNDERSCORE = str.maketrans({c: '_' for c in '<>:"/\\|?* \xa0'})
+_UNDERSCORES = re.compile(r'_+')
+
+
+@cache
+def sanitize_filename(name: str) -> str:
+    """Convert drug name to a safe filename."""
+    return _UNDERSCORES.sub('_', name.translate(_UNSAFE_TO_UNDERSCORE)).strip('_')
+
+
+def load_page_names(names_file: Path) -> dict[str, list[int]]:
+    """Load drug name to page mapping from page_names.json."""
+    if names_file.exists():
+        with open(names_file, encoding="utf-8") as f:
+            return json.load(f)
+    return {}